@@ -13,16 +13,42 @@ Key improvements over v1:
 """
 
 import sys
+import os
 import json
-import math
+import numpy as np
 from ortools.constraint_solver import routing_enums_pb2, pywrapcp
 
+# orjson handles the multi-megabyte matrix payloads several times faster
+# than stdlib json; fall back silently when it is not installed.
+try:
+    import orjson
+    _loads = orjson.loads
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _loads = json.loads
+    _dumps = json.dumps
+
+# Debug chatter is off unless VRP_DEBUG=1 — each _dbg call is an f-string
+# format plus a flushed stderr write, which adds up across tight re-opt
+# batches. Errors always print.
+DEBUG = bool(int(os.environ.get("VRP_DEBUG", "0")))
+
 
 def _err(msg):
     print(f"[PYTHON_ERR] {msg}", file=sys.stderr, flush=True)
 
 def _dbg(msg):
-    print(f"[PYTHON_DBG] {msg}", file=sys.stderr, flush=True)
+    if DEBUG:
+        print(f"[PYTHON_DBG] {msg}", file=sys.stderr, flush=True)
+
+def _fail_fast():
+    """Exit 1 skipping interpreter teardown: the failure payloads are
+    flushed here, and gc/atexit plus the destructors of everything the
+    ortools bindings allocated are pure latency for a dying process."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(1)
 
 
 # ─── data model ───────────────────────────────────────────────────────────────
@@ -31,10 +57,19 @@ def create_data_model(inp):
     BIG = 999_999_999
 
     def to_int_matrix(raw):
-        return [
-            [int(round(v)) if v is not None else BIG for v in row]
-            for row in raw
-        ]
+        # Vectorized: one C-level rint over the whole matrix instead of an
+        # int(round(v)) call per cell. None cells only force the slow path.
+        try:
+            arr = np.asarray(raw, dtype=np.float64)
+        except (TypeError, ValueError):
+            arr = np.array(
+                [[np.nan if v is None else v for v in row] for row in raw],
+                dtype=np.float64,
+            )
+        if arr.ndim != 2 or arr.shape[0] != arr.shape[1]:
+            raise ValueError("matrix is not square")
+        arr = np.where(np.isnan(arr), BIG, np.rint(arr))
+        return arr.astype(np.int64).tolist()
 
     data = {}
     data["distance_matrix"] = to_int_matrix(inp["distance_matrix"])
@@ -80,8 +115,7 @@ def create_data_model(inp):
     # Validation
     n = len(data["distance_matrix"])
     if n > 0:
-        if not all(len(r) == n for r in data["distance_matrix"]):
-            raise ValueError("distance_matrix is not square")
+        # squareness is enforced by to_int_matrix's shape check
         if len(data["demands"]) != n:
             raise ValueError("demands length mismatch")
         if len(data["service_times"]) != n:
@@ -107,9 +141,16 @@ def solve(data):
         return {"routes": [], "dropped_node_indices": list(range(1, n))}
 
     manager = pywrapcp.RoutingIndexManager(n, data["num_vehicles"], depot)
-    routing  = pywrapcp.RoutingModel(manager)
 
-    # ── Cost callback: travel distance + direction penalty + lateral penalty ──
+    # C++-side callback cache (bounded) plus single-vehicle-class reduction
+    # when the fleet is uniform — cost is already shared across vehicles.
+    model_params = pywrapcp.DefaultRoutingModelParameters()
+    model_params.max_callback_cache_size = min(n * n, 1_000_000)
+    if len(set(data["vehicle_capacities"])) <= 1:
+        model_params.reduce_vehicle_cost_model = True
+    routing = pywrapcp.RoutingModel(manager, model_params)
+
+    # ── Arc cost: travel distance + direction penalty + lateral penalty ──────
     # Direction term — for PICKUP penalise moving further away from depot
     # (increasing dist-to-depot); for DROPOFF penalise moving closer. Bakes
     # monotonic (no-backtracking) routes directly into the solver objective.
@@ -118,6 +159,10 @@ def solve(data):
     # snake side-to-side across a sector at constant depth with zero penalty:
     # routes stay monotonic in depth yet look zigzaggy on the map. Cross-track
     # distance is approximated as arc length: |Δbearing| × mean depth.
+    #
+    # The full penalized cost matrix is materialised once here and handed to
+    # the C++ core via RegisterTransitMatrix, so the search never calls back
+    # into Python per arc.
     penalty_weight = data["direction_penalty_weight"]
     lateral_weight = data["lateral_penalty_weight"]
     bearings       = data["node_bearings_deg"]
@@ -131,80 +176,88 @@ def solve(data):
         and depths   and len(depths)   == n
     )
 
-    def cost_callback(from_idx, to_idx):
-        from_node = manager.IndexToNode(from_idx)
-        to_node   = manager.IndexToNode(to_idx)
-
-        travel = dist_matrix[from_node][to_node]
-        penalty = 0
-
-        if from_node != depot and to_node != depot:
-            if penalty_weight > 0:
-                dist_from_to_depot = dist_matrix[from_node][depot]
-                dist_to_to_depot   = dist_matrix[to_node][depot]
-
-                if trip_type == "PICKUP":
-                    # Moving away from depot is bad (pickup order should converge on depot)
-                    increase = dist_to_to_depot - dist_from_to_depot
-                    if increase > 0:
-                        penalty += int(penalty_weight * increase)
-                else:
-                    # DROPOFF: moving back towards depot is bad (should go outward)
-                    decrease = dist_from_to_depot - dist_to_to_depot
-                    if decrease > 0:
-                        penalty += int(penalty_weight * decrease)
-
-            if use_lateral:
-                diff = abs(bearings[from_node] - bearings[to_node]) % 360.0
-                if diff > 180.0:
-                    diff = 360.0 - diff
-                cross_track_m = math.radians(diff) * (depths[from_node] + depths[to_node]) / 2.0
-                penalty += int(lateral_weight * cross_track_m)
-
-        return travel + penalty
-
-    cost_cb_idx = routing.RegisterTransitCallback(cost_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(cost_cb_idx)
+    if penalty_weight <= 0 and not use_lateral:
+        # No penalty terms requested: the distance matrix *is* the cost
+        # matrix, so skip the whole penalty build.
+        penalized = dist_matrix
+    else:
+        dm  = np.asarray(dist_matrix, dtype=np.int64)
+        pen = np.zeros((n, n), dtype=np.int64)
+
+        if penalty_weight > 0:
+            # Rank-1 outer subtraction of the depot-distance column,
+            # sign-clamped. Copied out contiguously once: the column view is
+            # strided, and both broadcast operands below would otherwise walk
+            # it with an N-element stride.
+            col = np.ascontiguousarray(dm[:, depot])
+            if trip_type == "PICKUP":
+                increase = col[None, :] - col[:, None]
+            else:
+                increase = col[:, None] - col[None, :]
+            pen += (penalty_weight * np.maximum(0, increase)).astype(np.int64)
+
+        if use_lateral:
+            b = np.asarray(bearings, dtype=np.float64)
+            d = np.asarray(depths, dtype=np.float64)
+            diff = np.abs(b[:, None] - b[None, :]) % 360.0
+            diff = np.where(diff > 180.0, 360.0 - diff, diff)
+            cross_track_m = np.radians(diff) * (d[:, None] + d[None, :]) / 2.0
+            pen += (lateral_weight * cross_track_m).astype(np.int64)
+
+        # Arcs touching the depot carry no penalty
+        pen[depot, :] = 0
+        pen[:, depot] = 0
+
+        penalized = (dm + pen).tolist()
+
+    cost_idx = routing.RegisterTransitMatrix(penalized)
+    routing.SetArcCostEvaluatorOfAllVehicles(cost_idx)
 
     # ── Capacity dimension ────────────────────────────────────────────────────
-    def demand_callback(from_idx):
-        return data["demands"][manager.IndexToNode(from_idx)]
-
-    demand_cb_idx = routing.RegisterUnaryTransitCallback(demand_callback)
+    # Demands are a static per-node vector — hand them to the C++ core
+    # directly rather than through a Python unary callback.
+    demand_idx = routing.RegisterUnaryTransitVector(data["demands"])
     routing.AddDimensionWithVehicleCapacity(
-        demand_cb_idx, 0, data["vehicle_capacities"], True, "Capacity"
+        demand_idx, 0, data["vehicle_capacities"], True, "Capacity"
     )
 
     # ── Max route duration dimension ──────────────────────────────────────────
     if data["max_route_duration"] is not None:
-        dur_matrix = data["duration_matrix"]
-        svc_times  = data["service_times"]
-
-        def duration_callback(from_idx, to_idx):
-            from_node = manager.IndexToNode(from_idx)
-            to_node   = manager.IndexToNode(to_idx)
-            return svc_times[from_node] + dur_matrix[from_node][to_node]
-
-        dur_cb_idx = routing.RegisterTransitCallback(duration_callback)
+        # Fuse service time into the travel matrix once at build time:
+        # D[i][j] = service[i] + duration[i][j], registered as a matrix so
+        # the dimension never calls back into Python.
+        dur = np.asarray(data["duration_matrix"], dtype=np.int64)
+        svc = np.asarray(data["service_times"], dtype=np.int64)[:, None]
+        fused = (dur + svc).tolist()
+        dur_idx = routing.RegisterTransitMatrix(fused)
         routing.AddDimension(
-            dur_cb_idx, 0, data["max_route_duration"], False, "Duration"
+            dur_idx, 0, data["max_route_duration"], False, "Duration"
         )
 
     # ── Allow dropping visits ─────────────────────────────────────────────────
     if data["allow_dropping_visits"]:
         pen = data["drop_visit_penalty"]
+        # One batched NodeToIndex sweep instead of a SWIG call per node.
+        n2i = [manager.NodeToIndex(i) for i in range(n)]
         for node in range(n):
             if node == depot:
                 continue
-            routing.AddDisjunction([manager.NodeToIndex(node)], pen)
+            routing.AddDisjunction([n2i[node]], pen)
 
     # ── Search parameters ─────────────────────────────────────────────────────
     params = pywrapcp.DefaultRoutingSearchParameters()
 
-    # PATH_CHEAPEST_ARC scales much better than AUTOMATIC for large instances
-    params.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    )
+    # PATH_CHEAPEST_ARC scales much better than AUTOMATIC for large instances.
+    # When visits may be dropped the problem is insertion-shaped, and
+    # PARALLEL_CHEAPEST_INSERTION handles the disjunctions better.
+    if data["allow_dropping_visits"]:
+        params.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
+        )
+    else:
+        params.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        )
     params.local_search_metaheuristic = (
         routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
     )
@@ -227,12 +280,23 @@ def solve(data):
     routed_nodes = set()
 
     if solution:
+        # IndexToNode crosses the SWIG boundary per call; batch every routing
+        # index (vehicle end indices map back to the depot) into one array.
+        node_of = np.fromiter(
+            (manager.IndexToNode(i) for i in range(routing.Size() + data["num_vehicles"])),
+            dtype=np.int64,
+        )
+        # Bound methods resolved once — attribute lookup on SWIG proxies is
+        # comparatively expensive and the walk below does it per visit.
+        is_end    = routing.IsEnd
+        next_var  = routing.NextVar
+        sol_value = solution.Value
         for vid in range(data["num_vehicles"]):
             idx   = routing.Start(vid)
             nodes = []
-            while not routing.IsEnd(idx):
-                node = manager.IndexToNode(idx)
-                idx  = solution.Value(routing.NextVar(idx))
+            while not is_end(idx):
+                node = int(node_of[idx])
+                idx  = sol_value(next_var(idx))
                 if node != depot:
                     nodes.append(node)
                     routed_nodes.add(node)
@@ -241,11 +305,9 @@ def solve(data):
     else:
         _err("No solution found")
 
-    # Dropped = all non-depot nodes not present in any route
-    dropped = [
-        i for i in range(n)
-        if i != depot and i not in routed_nodes
-    ]
+    # Dropped = all non-depot nodes not present in any route, as one
+    # C-level set difference rather than a per-node membership loop.
+    dropped = sorted(set(range(n)) - routed_nodes - {depot})
 
     _dbg(f"Routes: {len(routes_out)}, Dropped: {len(dropped)}")
     return {"routes": routes_out, "dropped_node_indices": dropped}
@@ -254,18 +316,48 @@ def solve(data):
 # ─── entry point ──────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    raw = sys.stdin.read()
-    if not raw.strip():
-        print(json.dumps({"error": "No input", "routes": [], "dropped_node_indices": []}))
-        sys.exit(1)
-
-    try:
-        inp  = json.loads(raw)
-        data = create_data_model(inp)
-        result = solve(data)
-        print(json.dumps(result))
-    except Exception as e:
-        import traceback
-        _err(traceback.format_exc())
-        print(json.dumps({"error": str(e), "routes": [], "dropped_node_indices": []}))
-        sys.exit(1)
+    # Persistent worker: one JSON request per stdin line, one JSON response
+    # per stdout line. Today's callers write a single request and close the
+    # pipe (EOF ends the loop), but a caller that keeps it open amortizes
+    # interpreter + ortools startup across every solve. Pretty-printed
+    # single documents still work — lines accumulate until they parse.
+    # Bytes all the way to the parser: json.loads and orjson.loads both
+    # accept them, so the up-front UTF-8 decode of a large payload is
+    # skipped.
+    pending = b""
+    handled = 0
+    failed  = False
+    for line in sys.stdin.buffer:
+        if not pending and not line.strip():
+            continue
+        pending += line
+        try:
+            inp = _loads(pending)
+        except json.JSONDecodeError:
+            continue  # request may span lines; keep accumulating
+        pending = b""
+        handled += 1
+        try:
+            result = solve(create_data_model(inp))
+            print(_dumps(result), flush=True)
+        except Exception as e:
+            import traceback
+            if DEBUG:
+                # Full frame-by-frame traceback only when asked for it —
+                # formatting a deep SWIG stack per failed retry adds up.
+                _err(traceback.format_exc())
+            else:
+                _err("".join(traceback.format_exception_only(type(e), e)).rstrip())
+            print(_dumps({"error": str(e), "routes": [], "dropped_node_indices": []}), flush=True)
+            failed = True
+
+    if pending.strip():
+        _err("unparseable trailing input")
+        print(_dumps({"error": "No valid JSON in input", "routes": [], "dropped_node_indices": []}))
+        _fail_fast()
+    if handled == 0:
+        print(_dumps({"error": "No input", "routes": [], "dropped_node_indices": []}))
+        _fail_fast()
+    if failed:
+        _fail_fast()
+    sys.exit(0)